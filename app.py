@@ -1,8 +1,17 @@
+import codecs
 import csv
+import hashlib
 import io
+import queue
+import re
 import uuid
 import threading
-from typing import Dict, Any, List
+import time
+from collections import OrderedDict, namedtuple
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Tuple
+
+import orjson
 
 from flask import (
     Flask,
@@ -12,19 +21,98 @@ from flask import (
     request,
     url_for,
     make_response,
+    Response,
 )
 
-from crawler_service import crawl_site
+from crawler_service import crawl_site_with_progress
 
 
 app = Flask(__name__)
 
-# Very simple in-memory storage of crawl results keyed by ID.
+
+class LRUDict(OrderedDict):
+    """
+    Size-bounded dict that evicts the least recently used entry once full.
+    Not thread-safe on its own: callers hold _STATE_LOCK around every access.
+    """
+
+    def __init__(self, maxsize: int = 128):
+        super().__init__()
+        self.maxsize = maxsize
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        self.move_to_end(key)
+        return value
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        if len(self) > self.maxsize:
+            self.popitem(last=False)
+
+
+# Immutable progress snapshot; converted to a dict only when serialized.
+Progress = namedtuple("Progress", "status progress total current error", defaults=(None,))
+_UNKNOWN_PROGRESS = Progress("unknown", 0, 0, 0)
+
+
+# Very simple in-memory storage of crawl results keyed by ID, bounded so old
+# crawls are evicted instead of leaking for the lifetime of the process.
 # In production you'd persist this in a database or cache.
-CRAWL_RESULTS: Dict[str, List[Dict[str, Any]]] = {}
-CRAWL_PROGRESS: Dict[str, Dict[str, Any]] = {}  # crawl_id -> {status, progress, total, current}
+# Crawl threads write these while request threads read them, so every access
+# goes through _STATE_LOCK. Progress entries are immutable tuples, so one read
+# under the lock stays a consistent snapshot after it's released.
+_STATE_LOCK = threading.Lock()
+# Each result entry is (cleaned products, serialized artifacts) so both are
+# evicted together. Artifacts are the downloads/API bodies and their ETags,
+# built once when a crawl completes: {api_json, json, csv} -> (body, etag).
+CrawlResult = Tuple[List[Dict[str, Any]], Dict[str, Tuple[bytes, str]]]
+CRAWL_RESULTS: Dict[str, CrawlResult] = LRUDict(128)
+CRAWL_PROGRESS: Dict[str, Progress] = LRUDict(256)
+# Crawls submitted but not yet started, in submission order.
+_QUEUED_CRAWLS: Dict[str, None] = {}
+
+# At most two crawls run at once (each opens up to 8 browser pages); further
+# submissions wait in _CRAWL_QUEUE instead of spawning more threads. Workers are
+# daemon threads, so exiting the server doesn't wait for queued crawls.
+_CRAWL_WORKERS = 2
+# Submissions beyond this many waiting crawls are rejected with 503. Keeping
+# waiting + running crawls well under CRAWL_PROGRESS.maxsize means their
+# progress entries can't be pushed out of the LRU while they're still active.
+_MAX_QUEUED_CRAWLS = 32
+_CRAWL_QUEUE: "queue.Queue[Tuple[str, str, int]]" = queue.Queue()
+_WORKERS_STARTED = False
+_WORKERS_LOCK = threading.Lock()
+
+# CSV columns: the fields produced by crawler_service.build_product_schema(),
+# the "image" alias that _clean_products also accepts, and source_page.
+CSV_FIELDS = (
+    "name",
+    "price",
+    "image_url",
+    "image",
+    "product_href",
+    "description",
+    "product_url",
+    "source_page",
+)
 
+# Last time each running crawl's progress was written, for throttling callbacks.
+_LAST_PROGRESS_WRITE: Dict[str, Tuple[float, str]] = {}  # crawl_id -> (monotonic time, status)
+_PROGRESS_MIN_INTERVAL = 0.1  # seconds; at most ~10 progress writes per second per crawl
 
+
+_PICTURE_PREFIX = re.compile(r"^\s*picture of\s*", re.IGNORECASE)
+
+
+@lru_cache(maxsize=4096)
 def _normalize_name(name: str) -> str:
     """
     Normalize product name for deduplication:
@@ -34,25 +122,15 @@ def _normalize_name(name: str) -> str:
     """
     if not name:
         return ""
-    normalized = name.strip()
-    # Remove "Picture of" prefix if present
-    if normalized.lower().startswith("picture of"):
-        normalized = normalized[10:].strip()
-    return normalized.lower()
+    return _PICTURE_PREFIX.sub("", name, count=1).strip().lower()
 
 
-def _score_product_completeness(product: Dict[str, Any]) -> int:
+def _completeness_score(name: str, price: str, image: str, href: str, description: str) -> int:
     """
-    Score a product by how complete its information is.
+    Score already-stripped product fields by how complete they are.
     Higher score = more complete information.
     """
     score = 0
-    name = (product.get("name") or "").strip()
-    price = (product.get("price") or "").strip()
-    image = (product.get("image_url") or product.get("image") or "").strip()
-    href = (product.get("product_href") or "").strip()
-    description = (product.get("description") or "").strip()
-
     if name:
         score += 10
     if price:
@@ -67,62 +145,159 @@ def _score_product_completeness(product: Dict[str, Any]) -> int:
     return score
 
 
+def _score_product_completeness(product: Dict[str, Any]) -> int:
+    """
+    Score a product by how complete its information is.
+    Higher score = more complete information.
+    """
+    return _completeness_score(
+        (product.get("name") or "").strip(),
+        (product.get("price") or "").strip(),
+        (product.get("image_url") or product.get("image") or "").strip(),
+        (product.get("product_href") or "").strip(),
+        (product.get("description") or "").strip(),
+    )
+
+
+def _merge_products(base: Dict[str, Any], other: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Merge two records of the same product into a new dict.
+    Fields from `base` win; empty ones are filled in from `other`.
+    """
+    merged = dict(base)
+    for field, value in other.items():
+        if value and not merged.get(field):
+            merged[field] = value
+    return merged
+
+
 def _clean_products(products: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """
     Remove empty / useless rows and deduplicate products before exposing as CSV/JSON.
-    When duplicates exist, keeps the one with the most complete information.
+    When duplicates exist, merges them, preferring the most complete record.
 
     Rules:
     - REQUIRED: Drop rows that don't have an image_url (strict requirement).
-    - Group products by normalized name (or product_href if name is missing).
-    - For each group, keep only the product with the highest completeness score.
+    - Index products by normalized name and by product_href; a product matching
+      either index is a duplicate of the product already stored there. An href
+      match only counts when at most one side has a name or the names agree,
+      since tiles for different products can share a category or cart link.
+    - Duplicates are merged field by field: the higher completeness score wins,
+      and its empty fields are filled from the other record.
     """
-    # First pass: filter out products WITHOUT image_url (strict requirement)
-    valid_products: List[Dict[str, Any]] = []
+    # (score, product); score stays None until the entry is first involved in a
+    # collision, since most keys are unique and never need scoring. Once
+    # computed it is cached, so later collisions don't re-score the entry.
+    items: List[Tuple[Optional[int], Dict[str, Any]]] = []
+    by_name: Dict[str, int] = {}  # name key -> index into items
+    by_href: Dict[str, int] = {}  # href key -> index into items
+    item_names: List[str] = []  # name key of each entry in items ("" if none)
+
     for raw in products:
         if not isinstance(raw, dict):
             continue
 
-        p = dict(raw)
-        image = (p.get("image_url") or p.get("image") or "").strip()
+        image = (raw.get("image_url") or raw.get("image") or "").strip()
 
         # STRICT: Only keep products that have an image_url
         if not image:
             continue
 
-        valid_products.append(p)
-
-    # Second pass: group by normalized name or product_href, keep best one
-    product_groups: Dict[str, Dict[str, Any]] = {}
-
-    for product in valid_products:
-        name = (product.get("name") or "").strip()
-        href = (product.get("product_href") or "").strip()
-
-        # Use normalized name as key, fallback to product_href if name is empty
-        if name:
-            key = _normalize_name(name)
-        elif href:
-            key = href.lower().strip()
+        name = (raw.get("name") or "").strip()
+        price = (raw.get("price") or "").strip()
+        href = (raw.get("product_href") or "").strip()
+
+        name_key = _normalize_name(name)
+        # Placeholder links like "#" or "javascript:void(0)" are shared by many tiles
+        href_key = href.lower() if not href.startswith(("#", "javascript:")) else ""
+        if not name_key and not href_key:
+            # If no usable name or href, use a combination of available fields as key
+            name_key = f"{price}_{image}".lower()[:50]  # Truncate to avoid huge keys
+
+        idx = by_name.get(name_key) if name_key else None
+        if idx is None and href_key:
+            idx = by_href.get(href_key)
+            if idx is not None and name_key and item_names[idx] and item_names[idx] != name_key:
+                # Same link but a different product name: not a duplicate
+                idx = None
+
+        if idx is None:
+            idx = len(items)
+            items.append((None, raw))
+            item_names.append(name_key)
         else:
-            # If no name or href, use a combination of available fields as key
-            price = (product.get("price") or "").strip()
-            image = (product.get("image_url") or product.get("image") or "").strip()
-            key = f"{price}_{image}".lower()[:50]  # Truncate to avoid huge keys
+            if not item_names[idx]:
+                item_names[idx] = name_key
+            current_score, current = items[idx]
+            if current_score is None:
+                current_score = _score_product_completeness(current)
+            description = (raw.get("description") or "").strip()
+            score = _completeness_score(name, price, image, href, description)
+            if score > current_score:
+                merged = _merge_products(raw, current)
+            else:
+                merged = _merge_products(current, raw)
+            items[idx] = (_score_product_completeness(merged), merged)
+
+        if name_key:
+            by_name.setdefault(name_key, idx)
+        if href_key:
+            by_href.setdefault(href_key, idx)
+
+    # Copy so callers never share dicts with the raw crawl output
+    return [dict(product) for _, product in items]
+
+
+def _render_csv_bytes(products: List[Dict[str, Any]]) -> bytes:
+    """Render the CSV export directly into a bytes buffer, prefixed with a UTF-8 BOM."""
+    output = io.BytesIO()
+    # BOM so Excel picks up UTF-8
+    output.write(codecs.BOM_UTF8)
+
+    text = io.TextIOWrapper(output, encoding="utf-8", newline="", write_through=True)
+    writer = csv.DictWriter(text, fieldnames=CSV_FIELDS, extrasaction="ignore")
+    writer.writeheader()
+    writer.writerows(products)
+    text.flush()
+    # Detach so closing the wrapper doesn't close the buffer we read from
+    text.detach()
 
-        if not key:
-            continue
+    return output.getvalue()
 
-        # If we haven't seen this key, or if current product has higher score, keep it
-        if key not in product_groups:
-            product_groups[key] = product
-        else:
-            current_score = _score_product_completeness(product_groups[key])
-            new_score = _score_product_completeness(product)
-            if new_score > current_score:
-                product_groups[key] = product
 
-    return list(product_groups.values())
+def _build_artifacts(crawl_id: str, products: List[Dict[str, Any]]) -> Dict[str, Tuple[bytes, str]]:
+    """
+    Serialize a finished crawl once so the results API and downloads can serve
+    the same bytes on every request. Each body is paired with its ETag.
+    """
+    api_payload = {"crawl_id": crawl_id, "total": len(products), "products": products}
+    bodies = {
+        "api_json": orjson.dumps(api_payload),
+        "json": orjson.dumps(products, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS),
+        "csv": _render_csv_bytes(products),
+    }
+    return {
+        name: (body, hashlib.md5(body, usedforsecurity=False).hexdigest())
+        for name, body in bodies.items()
+    }
+
+
+def _cached_response(
+    artifact: Tuple[bytes, str],
+    content_type: str,
+    filename: Optional[str] = None,
+) -> Response:
+    """
+    Serve a prebuilt artifact. Results never change after completion, so
+    clients may cache it and revalidate with If-None-Match (answered with 304).
+    """
+    body, etag = artifact
+    resp = Response(body, content_type=content_type)
+    if filename:
+        resp.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "private, max-age=3600, immutable"
+    return resp.make_conditional(request)
 
 
 def _crawl_in_background(crawl_id: str, homepage: str, max_pages: int):
@@ -130,11 +305,10 @@ def _crawl_in_background(crawl_id: str, homepage: str, max_pages: int):
     Run crawl in background thread and update progress.
     """
     try:
-        CRAWL_PROGRESS[crawl_id] = {"status": "discovering", "progress": 0, "total": max_pages, "current": 0}
-        
-        # Import here to avoid circular import
-        from crawler_service import crawl_site_with_progress
-        
+        with _STATE_LOCK:
+            _QUEUED_CRAWLS.pop(crawl_id, None)
+            CRAWL_PROGRESS[crawl_id] = Progress("discovering", 0, max_pages, 0)
+
         def progress_cb(current: int, total: int, status: str):
             _update_progress(crawl_id, current, total, status)
         
@@ -145,22 +319,62 @@ def _crawl_in_background(crawl_id: str, homepage: str, max_pages: int):
         )
         
         products = _clean_products(products)
-        CRAWL_RESULTS[crawl_id] = products
-        CRAWL_PROGRESS[crawl_id] = {"status": "completed", "progress": 100, "total": len(products), "current": len(products)}
+        artifacts = _build_artifacts(crawl_id, products)
+        with _STATE_LOCK:
+            CRAWL_RESULTS[crawl_id] = (products, artifacts)
+            CRAWL_PROGRESS[crawl_id] = Progress("completed", 100, len(products), len(products))
     except Exception as e:
-        CRAWL_PROGRESS[crawl_id] = {"status": "error", "progress": 0, "total": 0, "current": 0, "error": str(e)}
+        with _STATE_LOCK:
+            CRAWL_PROGRESS[crawl_id] = Progress("error", 0, 0, 0, error=str(e))
+    finally:
+        _LAST_PROGRESS_WRITE.pop(crawl_id, None)
+
+
+def _crawl_worker():
+    """Run queued crawls one after another, forever."""
+    while True:
+        crawl_id, homepage, max_pages = _CRAWL_QUEUE.get()
+        try:
+            _crawl_in_background(crawl_id, homepage, max_pages)
+        finally:
+            _CRAWL_QUEUE.task_done()
+
+
+def _ensure_crawl_workers():
+    """Start the crawl worker threads on first use."""
+    global _WORKERS_STARTED
+    with _WORKERS_LOCK:
+        if _WORKERS_STARTED:
+            return
+        for i in range(_CRAWL_WORKERS):
+            threading.Thread(target=_crawl_worker, name=f"crawl-{i}", daemon=True).start()
+        _WORKERS_STARTED = True
 
 
 def _update_progress(crawl_id: str, current: int, total: int, status: str):
-    """Update progress for a crawl."""
-    if crawl_id in CRAWL_PROGRESS:
-        progress_pct = int((current / total * 100)) if total > 0 else 0
-        CRAWL_PROGRESS[crawl_id] = {
-            "status": status,
-            "progress": progress_pct,
-            "total": total,
-            "current": current
-        }
+    """
+    Update progress for a crawl.
+    Writes are throttled to one per _PROGRESS_MIN_INTERVAL, except when the
+    status changes or the crawl reaches a terminal state.
+    """
+    now = time.monotonic()
+    last_time, last_status = _LAST_PROGRESS_WRITE.get(crawl_id, (0.0, ""))
+    if (
+        status == last_status
+        and status not in ("completed", "error")
+        and now - last_time < _PROGRESS_MIN_INTERVAL
+    ):
+        return
+    _LAST_PROGRESS_WRITE[crawl_id] = (now, status)
+
+    progress_pct = int((current / total * 100)) if total > 0 else 0
+    progress = Progress(status, progress_pct, total, current)
+    with _STATE_LOCK:
+        previous = CRAWL_PROGRESS.get(crawl_id)
+        # Never overwrite a finished crawl with a late callback
+        if previous is None or previous.status in ("completed", "error"):
+            return
+        CRAWL_PROGRESS[crawl_id] = progress
 
 
 @app.route("/", methods=["GET"])
@@ -180,11 +394,17 @@ def start_crawl():
     max_pages = int(request.form.get("max_pages", "30") or "30")
 
     crawl_id = str(uuid.uuid4())
-    
-    # Start crawl in background thread
-    thread = threading.Thread(target=_crawl_in_background, args=(crawl_id, homepage, max_pages))
-    thread.daemon = True
-    thread.start()
+
+    # Queue crawl for the background workers; it starts once one is free
+    with _STATE_LOCK:
+        if len(_QUEUED_CRAWLS) >= _MAX_QUEUED_CRAWLS:
+            resp = jsonify({"error": "Too many crawls queued, try again later"})
+            resp.headers["Retry-After"] = "30"
+            return resp, 503
+        _QUEUED_CRAWLS[crawl_id] = None
+        CRAWL_PROGRESS[crawl_id] = Progress("queued", 0, max_pages, 0)
+    _ensure_crawl_workers()
+    _CRAWL_QUEUE.put((crawl_id, homepage, max_pages))
 
     resp = make_response(redirect(url_for("crawl_progress", crawl_id=crawl_id)))
     resp.set_cookie("last_crawl_id", crawl_id, max_age=60 * 60 * 24)
@@ -194,28 +414,38 @@ def start_crawl():
 @app.route("/progress/<crawl_id>", methods=["GET"])
 def crawl_progress(crawl_id: str):
     """Show crawl progress page."""
-    progress = CRAWL_PROGRESS.get(crawl_id, {"status": "unknown", "progress": 0, "total": 0, "current": 0})
+    with _STATE_LOCK:
+        progress = CRAWL_PROGRESS.get(crawl_id, _UNKNOWN_PROGRESS)
     return render_template("progress.html", crawl_id=crawl_id, progress=progress)
 
 
 @app.route("/api/progress/<crawl_id>", methods=["GET"])
 def api_progress(crawl_id: str):
     """API endpoint to check crawl progress."""
-    progress = CRAWL_PROGRESS.get(crawl_id, {"status": "unknown", "progress": 0, "total": 0, "current": 0})
-    
+    queue_position = None
+    with _STATE_LOCK:
+        progress = CRAWL_PROGRESS.get(crawl_id, _UNKNOWN_PROGRESS)
+        if progress.status == "queued" and crawl_id in _QUEUED_CRAWLS:
+            queue_position = list(_QUEUED_CRAWLS).index(crawl_id) + 1
+
+    payload = progress._asdict()
+    if payload["error"] is None:
+        del payload["error"]
+    if queue_position is not None:
+        payload["queue_position"] = queue_position
+
     # If completed, redirect to results
-    if progress.get("status") == "completed":
-        return jsonify({
-            **progress,
-            "redirect": url_for("view_results", crawl_id=crawl_id)
-        })
-    
-    return jsonify(progress)
+    if progress.status == "completed":
+        payload["redirect"] = url_for("view_results", crawl_id=crawl_id)
+
+    return Response(orjson.dumps(payload), mimetype="application/json")
 
 
 @app.route("/results/<crawl_id>", methods=["GET"])
 def view_results(crawl_id: str):
-    products = _clean_products(CRAWL_RESULTS.get(crawl_id, []))
+    # Stored results are already cleaned by _crawl_in_background
+    with _STATE_LOCK:
+        products, _ = CRAWL_RESULTS.get(crawl_id, ([], None))
     return render_template(
         "results.html",
         crawl_id=crawl_id,
@@ -229,46 +459,31 @@ def api_results(crawl_id: str):
     """
     JSON API: returns all extracted product data for a given crawl.
     """
-    products = _clean_products(CRAWL_RESULTS.get(crawl_id, []))
-    return jsonify(
-        {
-            "crawl_id": crawl_id,
-            "total": len(products),
-            "products": products,
-        }
-    )
+    with _STATE_LOCK:
+        result = CRAWL_RESULTS.get(crawl_id)
+    if result is None:
+        # Unknown or still running: nothing extracted yet
+        payload = {"crawl_id": crawl_id, "total": 0, "products": []}
+        return Response(orjson.dumps(payload), mimetype="application/json")
+
+    _, artifacts = result
+    return _cached_response(artifacts["api_json"], "application/json")
 
 
 @app.route("/download/<crawl_id>", methods=["GET"])
 def download_csv(crawl_id: str):
     """
-    Streams a CSV file of extracted product data.
-    Browsers will typically cache the download per usual HTTP semantics.
+    Download cleaned product data as a CSV file.
+    Sent with an ETag so repeat downloads can be answered with 304.
     """
-    products = _clean_products(CRAWL_RESULTS.get(crawl_id, []))
+    with _STATE_LOCK:
+        products, artifacts = CRAWL_RESULTS.get(crawl_id, ([], None))
     if not products:
         return jsonify({"error": "No data for this crawl id"}), 404
 
-    # Determine CSV headers from union of keys
-    fieldnames = set()
-    for p in products:
-        fieldnames.update(p.keys())
-    field_list = sorted(fieldnames)
-
-    output = io.StringIO()
-    writer = csv.DictWriter(output, fieldnames=field_list)
-    writer.writeheader()
-    for p in products:
-        writer.writerow(p)
-
-    csv_bytes = output.getvalue().encode("utf-8-sig")
-
-    resp = make_response(csv_bytes)
-    resp.headers["Content-Type"] = "text/csv; charset=utf-8"
-    resp.headers[
-        "Content-Disposition"
-    ] = f'attachment; filename="products_{crawl_id}.csv"'
-    return resp
+    return _cached_response(
+        artifacts["csv"], "text/csv; charset=utf-8", filename=f"products_{crawl_id}.csv"
+    )
 
 
 @app.route("/download_json/<crawl_id>", methods=["GET"])
@@ -276,23 +491,21 @@ def download_json(crawl_id: str):
     """
     Download cleaned product data as a JSON file.
     """
-    products = _clean_products(CRAWL_RESULTS.get(crawl_id, []))
+    with _STATE_LOCK:
+        products, artifacts = CRAWL_RESULTS.get(crawl_id, ([], None))
     if not products:
         return jsonify({"error": "No data for this crawl id"}), 404
 
-    import json
-
-    json_bytes = json.dumps(products, ensure_ascii=False, indent=2).encode("utf-8")
-
-    resp = make_response(json_bytes)
-    resp.headers["Content-Type"] = "application/json; charset=utf-8"
-    resp.headers[
-        "Content-Disposition"
-    ] = f'attachment; filename="products_{crawl_id}.json"'
-    return resp
+    return _cached_response(
+        artifacts["json"], "application/json; charset=utf-8", filename=f"products_{crawl_id}.json"
+    )
 
 
 if __name__ == "__main__":
-    # Run the Flask dev server
-    app.run(debug=True, host="0.0.0.0", port=5000)
+    # Run the Flask dev server with one thread per request so /api/progress
+    # polling isn't queued behind downloads or other requests.
+    # For deployment use a real WSGI server instead, e.g.:
+    #   gunicorn -k gthread -w 1 --threads 8 app:app
+    # (keep a single worker: crawl state lives in this process's memory)
+    app.run(host="0.0.0.0", port=5000, threaded=True)
 
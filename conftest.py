@@ -0,0 +1,25 @@
+"""
+Test setup for the unit tests in tests/.
+
+Run from the repository root:
+
+    pip install -r requirements-dev.txt
+    pytest
+
+The tests only exercise app.py, so the browser stack isn't needed. When
+crawl4ai isn't installed, a stub crawler_service is registered so app.py can
+still be imported; any test that actually crawls must monkeypatch it.
+"""
+import sys
+import types
+
+try:
+    import crawl4ai  # noqa: F401
+except ImportError:
+    _stub = types.ModuleType("crawler_service")
+
+    def _crawl_unavailable(*args, **kwargs):
+        raise RuntimeError("crawl4ai is not installed")
+
+    _stub.crawl_site_with_progress = _crawl_unavailable
+    sys.modules["crawler_service"] = _stub
@@ -1,9 +1,11 @@
 import asyncio
+import atexit
 import json
 import os
 import sys
-from typing import List, Dict, Any
-from urllib.parse import urlparse
+import threading
+from typing import List, Dict, Any, Optional
+from urllib.parse import urljoin, urlparse
 
 from crawl4ai import (
     AsyncWebCrawler,
@@ -13,6 +15,7 @@ from crawl4ai import (
     RateLimiter,
 )
 from crawl4ai.async_dispatcher import MemoryAdaptiveDispatcher
+from playwright.async_api import Error as PlaywrightError
 
 # On Windows consoles with cp1252 encoding, rich logging may emit Unicode arrows
 # and other characters that cause UnicodeEncodeError. Reconfigure stdout/stderr
@@ -26,28 +29,110 @@ if os.name == "nt":
         pass
 
 
-def _is_same_domain(base_url: str, candidate: str) -> bool:
+# One event loop shared by every synchronous crawl, running forever on a daemon
+# thread, instead of asyncio.run() creating and tearing down a loop per crawl.
+# Started on the first sync crawl rather than at import, so importing this
+# module (e.g. in a pre-forking server's master) has no side effects.
+_LOOP: Optional[asyncio.AbstractEventLoop] = None
+_LOOP_LOCK = threading.Lock()
+
+# Browser kept open across crawls so Chromium only starts once per process.
+# Only ever touched from coroutines running on _LOOP.
+_SHARED_CRAWLER: Optional["asyncio.Future[AsyncWebCrawler]"] = None
+
+# Errors meaning the browser itself died (crash, OOM kill, closed connection).
+# Crawl4AI turns most of these into failed CrawlResults rather than raising, so
+# this is only a fallback; _browser_is_alive() is the primary check.
+_BROWSER_ERRORS = (PlaywrightError, ConnectionError)
+
+
+async def _start_crawler() -> AsyncWebCrawler:
+    crawler = AsyncWebCrawler(verbose=False)
+    await crawler.start()
+    return crawler
+
+
+def _browser_is_alive(crawler: AsyncWebCrawler) -> bool:
+    """
+    Whether the crawler's Chromium is still connected. A crashed or killed
+    browser doesn't raise into our code: Crawl4AI reports every page as failed.
+    """
+    manager = getattr(crawler.crawler_strategy, "browser_manager", None)
+    browser = getattr(manager, "browser", None)
+    # No Browser object (e.g. persistent-context mode): nothing to check
+    return browser is None or browser.is_connected()
+
+
+async def _get_shared_crawler() -> AsyncWebCrawler:
+    """
+    Return the process-wide crawler, starting it on first use or replacing it
+    if its browser has died since the last crawl.
+    Concurrent callers wait on the same startup instead of launching two browsers.
+    """
+    global _SHARED_CRAWLER
+    # At most one replacement: a freshly started browser is used as-is
+    for attempt in range(2):
+        if _SHARED_CRAWLER is None:
+            _SHARED_CRAWLER = asyncio.ensure_future(_start_crawler())
+        try:
+            crawler = await asyncio.shield(_SHARED_CRAWLER)
+        except Exception:
+            _SHARED_CRAWLER = None
+            raise
+        if attempt or _browser_is_alive(crawler):
+            break
+        await _discard_shared_crawler(crawler)
+    return crawler
+
+
+async def _discard_shared_crawler(crawler: Optional[AsyncWebCrawler] = None) -> None:
     """
-    Keep only links that are on the same domain as the base URL.
+    Close the shared crawler and forget it so the next crawl starts a fresh browser.
+    If `crawler` is given, only discard it if it is still the shared one.
     """
+    global _SHARED_CRAWLER
+    future = _SHARED_CRAWLER
+    if future is None or not future.done() or future.cancelled() or future.exception() is not None:
+        return
+    current = future.result()
+    if crawler is not None and current is not crawler:
+        return
+    _SHARED_CRAWLER = None
     try:
-        base = urlparse(base_url)
-        link = urlparse(candidate)
+        await current.close()
     except Exception:
-        return False
+        # The browser may already be gone; nothing left to clean up
+        pass
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    """Return the shared crawl loop, starting its thread on first use."""
+    global _LOOP
+    with _LOOP_LOCK:
+        if _LOOP is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="crawl-loop", daemon=True).start()
+            _LOOP = loop
+        return _LOOP
+
+
+def _close_shared_crawler() -> None:
+    """Shut the shared browser down at interpreter exit."""
+    if _LOOP is None:
+        return
+    try:
+        asyncio.run_coroutine_threadsafe(_discard_shared_crawler(), _LOOP).result(timeout=10)
+    except Exception:
+        pass
 
-    if not link.scheme:
-        return True  # relative URL, we'll handle later
 
-    return base.netloc == link.netloc
+atexit.register(_close_shared_crawler)
 
 
 def _normalize_url(base_url: str, link: str) -> str:
     """
     Convert relative URLs to absolute based on base_url.
     """
-    from urllib.parse import urljoin
-
     return urljoin(base_url, link)
 
 
@@ -127,14 +212,22 @@ async def _discover_links(crawler: AsyncWebCrawler, home_url: str, max_pages: in
 
     result = await crawler.arun(url=home_url, config=config)
 
-    urls: List[str] = []
-    seen: set[str] = set()
+    # Insertion-ordered dict doubles as the dedup set and the result list
+    urls: Dict[str, None] = {}
+    base_netloc = urlparse(home_url).netloc
 
     def add_url(u: str) -> None:
         normalized = _normalize_url(home_url, u)
-        if normalized not in seen and _is_same_domain(home_url, normalized):
-            seen.add(normalized)
-            urls.append(normalized)
+        if normalized in urls:
+            return
+        # Keep only links that are on the same domain as the homepage
+        try:
+            link = urlparse(normalized)
+        except ValueError:
+            return
+        if link.scheme and link.netloc != base_netloc:
+            return
+        urls[normalized] = None
 
     # Always include the homepage first
     add_url(home_url)
@@ -155,13 +248,14 @@ async def _discover_links(crawler: AsyncWebCrawler, home_url: str, max_pages: in
                 break
 
     # Fallback: if we didn't find enough URLs, just return whatever we have
-    return urls[:max_pages]
+    return list(urls)[:max_pages]
 
 
 async def crawl_site_async(
     home_url: str, 
     max_pages: int = 30,
-    progress_callback=None
+    progress_callback=None,
+    crawler: Optional[AsyncWebCrawler] = None,
 ) -> List[Dict[str, Any]]:
     """
     Multi-URL crawl using Crawl4AI with JSON CSS extraction (no LLM).
@@ -172,7 +266,22 @@ async def crawl_site_async(
     
     Args:
         progress_callback: Optional callback(current, total, status) called during crawl.
+        crawler: Optional already-started crawler to reuse. If omitted, a new one
+            is opened and closed around this crawl.
     """
+    if crawler is None:
+        async with AsyncWebCrawler(verbose=False) as own_crawler:
+            return await _crawl_pages(own_crawler, home_url, max_pages, progress_callback)
+
+    return await _crawl_pages(crawler, home_url, max_pages, progress_callback)
+
+
+async def _crawl_pages(
+    crawler: AsyncWebCrawler,
+    home_url: str,
+    max_pages: int,
+    progress_callback=None,
+) -> List[Dict[str, Any]]:
     schema = build_product_schema()
     extraction_strategy = JsonCssExtractionStrategy(schema, verbose=False)
 
@@ -197,53 +306,76 @@ async def crawl_site_async(
 
     products: List[Dict[str, Any]] = []
 
-    async with AsyncWebCrawler(verbose=False) as crawler:
-        if progress_callback:
-            progress_callback(0, max_pages, "discovering")
-        
-        urls = await _discover_links(crawler, home_url, max_pages=max_pages)
+    if progress_callback:
+        progress_callback(0, max_pages, "discovering")
+    
+    urls = await _discover_links(crawler, home_url, max_pages=max_pages)
+
+    if not urls:
+        return []
 
-        if not urls:
-            return []
+    total_urls = len(urls)
+    if progress_callback:
+        progress_callback(0, total_urls, "crawling")
 
-        total_urls = len(urls)
+    # Multi-URL crawl using arun_many + dispatcher
+    results = await crawler.arun_many(
+        urls=urls,
+        config=run_config,
+        dispatcher=dispatcher,
+    )
+
+    processed = 0
+    for result in results:
+        processed += 1
         if progress_callback:
-            progress_callback(0, total_urls, "crawling")
+            progress_callback(processed, total_urls, "crawling")
+        
+        if not result.success or not result.extracted_content:
+            continue
 
-        # Multi-URL crawl using arun_many + dispatcher
-        results = await crawler.arun_many(
-            urls=urls,
-            config=run_config,
-            dispatcher=dispatcher,
-        )
+        try:
+            extracted = json.loads(result.extracted_content)
+        except json.JSONDecodeError:
+            continue
 
-        processed = 0
-        for result in results:
-            processed += 1
-            if progress_callback:
-                progress_callback(processed, total_urls, "crawling")
-            
-            if not result.success or not result.extracted_content:
-                continue
+        if not isinstance(extracted, list):
+            continue
 
-            try:
-                extracted = json.loads(result.extracted_content)
-            except json.JSONDecodeError:
+        for item in extracted:
+            if not isinstance(item, dict):
                 continue
+            item = dict(item)
+            # Attach source page for traceability
+            item.setdefault("source_page", result.url)
+            products.append(item)
 
-            if not isinstance(extracted, list):
-                continue
+    if progress_callback:
+        progress_callback(total_urls, total_urls, "extracting")
 
-            for item in extracted:
-                if not isinstance(item, dict):
-                    continue
-                item = dict(item)
-                # Attach source page for traceability
-                item.setdefault("source_page", result.url)
-                products.append(item)
+    return products
 
-        if progress_callback:
-            progress_callback(total_urls, total_urls, "extracting")
+
+async def _crawl_with_shared_crawler(
+    home_url: str,
+    max_pages: int,
+    progress_callback=None,
+) -> List[Dict[str, Any]]:
+    crawler = await _get_shared_crawler()
+    try:
+        products = await crawl_site_async(
+            home_url, max_pages=max_pages, progress_callback=progress_callback, crawler=crawler
+        )
+    except _BROWSER_ERRORS:
+        # Don't hand a dead browser to every later crawl
+        await _discard_shared_crawler(crawler)
+        raise
+
+    if not _browser_is_alive(crawler):
+        # Browser died mid-crawl: pages were reported as failed rather than
+        # raising, so fail the crawl instead of "completing" with missing products
+        await _discard_shared_crawler(crawler)
+        raise RuntimeError("Browser disconnected during crawl")
 
     return products
 
@@ -252,7 +384,10 @@ def crawl_site(home_url: str, max_pages: int = 30) -> List[Dict[str, Any]]:
     """
     Synchronous wrapper for Flask or other WSGI frameworks.
     """
-    return asyncio.run(crawl_site_async(home_url, max_pages=max_pages))
+    future = asyncio.run_coroutine_threadsafe(
+        _crawl_with_shared_crawler(home_url, max_pages=max_pages), _get_loop()
+    )
+    return future.result()
 
 
 def crawl_site_with_progress(
@@ -262,6 +397,10 @@ def crawl_site_with_progress(
 ) -> List[Dict[str, Any]]:
     """
     Synchronous wrapper with progress callback support.
+    The callback runs on the crawl event loop thread, not the caller's.
     """
-    return asyncio.run(crawl_site_async(home_url, max_pages=max_pages, progress_callback=progress_callback))
-
+    future = asyncio.run_coroutine_threadsafe(
+        _crawl_with_shared_crawler(home_url, max_pages=max_pages, progress_callback=progress_callback),
+        _get_loop(),
+    )
+    return future.result()
@@ -0,0 +1,34 @@
+import pytest
+
+from app import _clean_products
+
+
+@pytest.mark.parametrize("href", ["#", "javascript:void(0)"])
+def test_nameless_product_with_placeholder_href_is_kept(href):
+    products = [{"name": "", "price": "10", "image_url": "a.jpg", "product_href": href}]
+
+    assert _clean_products(products) == products
+
+
+def test_shared_href_does_not_merge_differently_named_products():
+    products = [
+        {"name": "Milk 1L", "image_url": "m.jpg", "product_href": "/category/dairy"},
+        {"name": "Yogurt", "image_url": "y.jpg", "product_href": "/category/dairy"},
+    ]
+
+    cleaned = _clean_products(products)
+
+    assert [p["name"] for p in cleaned] == ["Milk 1L", "Yogurt"]
+
+
+def test_shared_href_merges_nameless_duplicate():
+    products = [
+        {"name": "Milk 1L", "image_url": "m.jpg", "product_href": "/p/milk"},
+        {"name": "", "price": "৳90", "image_url": "m.jpg", "product_href": "/p/milk"},
+    ]
+
+    cleaned = _clean_products(products)
+
+    assert len(cleaned) == 1
+    assert cleaned[0]["name"] == "Milk 1L"
+    assert cleaned[0]["price"] == "৳90"
@@ -0,0 +1,33 @@
+from app import LRUDict
+
+
+def test_evicts_oldest_entry_past_maxsize():
+    d = LRUDict(2)
+    d["a"] = 1
+    d["b"] = 2
+    d["c"] = 3
+
+    assert list(d) == ["b", "c"]
+
+
+def test_get_marks_entry_as_recently_used():
+    d = LRUDict(2)
+    d["a"] = 1
+    d["b"] = 2
+
+    assert d.get("a") == 1
+    d["c"] = 3
+
+    assert list(d) == ["a", "c"]
+    assert d.get("b") is None
+    assert d.get("b", "missing") == "missing"
+
+
+def test_overwrite_refreshes_without_growing():
+    d = LRUDict(2)
+    d["a"] = 1
+    d["b"] = 2
+    d["a"] = 10
+    d["c"] = 3
+
+    assert dict(d) == {"a": 10, "c": 3}
@@ -0,0 +1,59 @@
+import pytest
+
+import app as app_module
+from app import Progress
+
+
+CRAWL_ID = "crawl-1"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    progress = app_module.LRUDict(8)
+    progress[CRAWL_ID] = Progress("discovering", 0, 10, 0)
+    monkeypatch.setattr(app_module, "CRAWL_PROGRESS", progress)
+    monkeypatch.setattr(app_module, "_LAST_PROGRESS_WRITE", {})
+
+    fake = FakeClock()
+    monkeypatch.setattr(app_module.time, "monotonic", fake)
+    return fake
+
+
+def current():
+    return app_module.CRAWL_PROGRESS[CRAWL_ID]
+
+
+def test_same_status_writes_within_interval_are_dropped(clock):
+    app_module._update_progress(CRAWL_ID, 1, 10, "crawling")
+    clock.now += 0.05
+    app_module._update_progress(CRAWL_ID, 2, 10, "crawling")
+
+    assert current().current == 1
+
+    clock.now += 0.1
+    app_module._update_progress(CRAWL_ID, 3, 10, "crawling")
+
+    assert current() == Progress("crawling", 30, 10, 3)
+
+
+def test_status_change_is_never_throttled(clock):
+    app_module._update_progress(CRAWL_ID, 10, 10, "crawling")
+    clock.now += 0.01
+    app_module._update_progress(CRAWL_ID, 10, 10, "extracting")
+
+    assert current().status == "extracting"
+
+
+def test_finished_crawl_is_not_overwritten(clock):
+    app_module.CRAWL_PROGRESS[CRAWL_ID] = Progress("completed", 100, 3, 3)
+    app_module._update_progress(CRAWL_ID, 1, 10, "crawling")
+
+    assert current().status == "completed"
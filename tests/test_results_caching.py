@@ -0,0 +1,41 @@
+import pytest
+
+import app as app_module
+
+
+CRAWL_ID = "crawl-1"
+PRODUCTS = [{"name": "Milk 1L", "price": "৳90", "image_url": "m.jpg"}]
+
+
+@pytest.fixture
+def client(monkeypatch):
+    results = app_module.LRUDict(8)
+    results[CRAWL_ID] = (PRODUCTS, app_module._build_artifacts(CRAWL_ID, PRODUCTS))
+    monkeypatch.setattr(app_module, "CRAWL_RESULTS", results)
+    return app_module.app.test_client()
+
+
+@pytest.mark.parametrize(
+    "path",
+    [f"/api/results/{CRAWL_ID}", f"/download/{CRAWL_ID}", f"/download_json/{CRAWL_ID}"],
+)
+def test_matching_etag_returns_304(client, path):
+    first = client.get(path)
+    assert first.status_code == 200
+    assert first.headers["ETag"]
+    assert "immutable" in first.headers["Cache-Control"]
+
+    second = client.get(path, headers={"If-None-Match": first.headers["ETag"]})
+    assert second.status_code == 304
+    assert second.data == b""
+
+
+def test_stale_etag_returns_full_body(client):
+    resp = client.get(f"/api/results/{CRAWL_ID}", headers={"If-None-Match": '"stale"'})
+
+    assert resp.status_code == 200
+    assert resp.get_json()["products"] == PRODUCTS
+
+
+def test_unknown_crawl_download_is_404(client):
+    assert client.get("/download/unknown").status_code == 404